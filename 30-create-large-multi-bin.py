@@ -1,62 +1,245 @@
+import errno
+import mmap
 import os
 import random
 import shutil
+import struct
+import sys
 import multiprocessing
+import threading
 import time
-from functools import partial
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 
-def generate_single_file(file_info, progress_queue):
-    """生成单个文件的函数，带有实时进度报告"""
-    filename, file_size = file_info
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
-    # 使用优化的缓冲区大小 - 512KB
-    buffer_size = 512 * 1024  # 512KB缓冲区
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# 写入缓冲区大小 - 4MB（页大小的整数倍），减少系统调用次数
+BUFFER_SIZE = 4 * MB
+
+# 随机模板是缓冲区大小的几倍，每个块从模板中随机的4096字节对齐位置开始切片
+TEMPLATE_BUFFERS = 4
+
+# 以下每个子进程的状态由进程池初始化函数一次性创建，供该进程处理的所有文件复用：
+# 缓冲区大小和按页对齐的随机模板。模板只在进程启动时用os.urandom生成一次，
+# 之后每个块只需选一个随机起点并改写块头16个字节，不再有逐块的随机数生成开销，
+# 写入速度只受磁盘带宽限制。起点按4096字节对齐，切片仍满足O_DIRECT的对齐要求。
+# 局限：数据仍全部来自每个进程的一份模板，按4KB粒度去重的存储仍能识别出重复的页。
+# 注意：用os.sendfile从/dev/urandom直接拷贝到文件虽然省去了用户态拷贝，但内核的
+# ChaCha20生成速度很低（实测约290 MB/s），因此不采用
+_buffer_size = BUFFER_SIZE
+_template = None
+# 本进程已产生的数据块计数，异或进块头，使每个块的前16个字节都不相同
+_block_counter = 0
+
+
+# 直接使用文件描述符写入，绕过Python文件对象的缓冲层（Windows上需要O_BINARY）
+_OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+# Linux上使用O_DIRECT绕过页缓存：写出的数据不会再被读取，没必要挤占页缓存。
+# O_DIRECT要求缓冲区地址、写入长度和文件偏移都按块对齐
+_O_DIRECT = getattr(os, "O_DIRECT", 0)
+_DIRECT_ALIGN = 4096
+
+
+def _open_output(filename):
+    """打开输出文件，尽量使用O_DIRECT；文件系统不支持（如tmpfs）时退回普通写入
+
+    返回 (文件描述符, 是否使用了O_DIRECT)。
+    """
+    if _O_DIRECT:
+        try:
+            return os.open(filename, _OPEN_FLAGS | _O_DIRECT, 0o644), True
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+    return os.open(filename, _OPEN_FLAGS, 0o644), False
+
+
+# 聚合模式下所有数据写入同一个大文件，每个“文件”只是其中的一段
+AGGREGATE_FILENAME = "d_all.bin"
+
+
+def _open_slab(offset):
+    """聚合模式：独立打开聚合文件并定位到offset，每个进程各自持有文件描述符
+
+    各区段的偏移量是任意的，不满足O_DIRECT的对齐要求，因此这里不使用O_DIRECT。
+    """
+    fd = os.open(AGGREGATE_FILENAME, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _disable_direct_io(fd):
+    """关闭fd上的O_DIRECT，用于写入文件末尾不满足对齐要求的部分"""
+    if fcntl is not None:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~_O_DIRECT)
+
+
+def _write_all(fd, data):
+    """把data完整写入fd，os.write可能只写入一部分，需要循环直到写完"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _preallocate(fd, size):
+    """写入前预先为文件分配空间，让文件系统一次性分配连续的区段
+
+    Linux上使用posix_fallocate真正预留磁盘块，磁盘空间不足时立即失败；
+    其他平台或文件系统不支持时退回到ftruncate直接设置文件长度。
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    try:
+        os.ftruncate(fd, size)
+    except OSError:
+        pass
+
+
+def _drop_page_cache(fd, offset, size, sync=True):
+    """通知内核丢弃fd中[offset, offset+size)对应的页缓存
+
+    脏页无法被丢弃，因此sync为True时先fdatasync。fdatasync会刷写整个文件，
+    聚合模式下会把其他进程正在写入的区段也一起同步刷出；O_DIRECT写入的文件
+    几乎不占页缓存，为它同步只会白白等待设备刷写。这两种情况传入sync=False，
+    只调用posix_fadvise（已写回的干净页会被丢弃）。
+    不支持posix_fadvise的平台（如Windows）直接跳过。
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    if sync:
+        os.fdatasync(fd)
+    os.posix_fadvise(fd, offset, size, os.POSIX_FADV_DONTNEED)
+
+
+# 进度消息类型，消息统一为元组：
+# (类型, pid, 文件名, 已写入字节数, 文件大小, 速度MB/s, 已用时间秒[, 错误信息])
+STARTED = 0
+PROGRESS = 1
+COMPLETED = 2
+ERROR = 3
+# 结束标记，主进程在所有任务完成后放入 (DONE,)，通知监控器退出
+DONE = 4
+
+# 进度队列，由进程池初始化函数在每个子进程中设置
+_progress_queue = None
+
+
+def _worker_init(progress_queue, buffer_size):
+    """进程池子进程的初始化函数
+
+    multiprocessing.Queue不能作为任务参数pickle传递，只能在创建子进程时继承。
+    随机模板在这里为每个进程单独生成一次，而不是每个文件都重新分配，
+    同时保证各进程的数据互不相同。
+    """
+    global _progress_queue, _buffer_size, _template
+    _progress_queue = progress_queue
+    _buffer_size = buffer_size
+    # 用匿名mmap分配，保证模板按页对齐（O_DIRECT要求）
+    template_size = buffer_size * TEMPLATE_BUFFERS
+    _template = mmap.mmap(-1, template_size)
+    _template[:] = os.urandom(template_size)
+
+
+def generate_single_file(file_info):
+    """生成单个文件的函数，带有实时进度报告
+
+    file_info为 (文件名, 文件大小, 偏移量)。偏移量为None时生成独立的文件；
+    否则为聚合模式，把数据写入聚合文件中从偏移量开始的区段，文件名仅用于显示。
+    """
+    global _block_counter
+    filename, file_size, offset = file_info
+    progress_queue = _progress_queue
 
     # 获取进程ID
     pid = os.getpid()
 
-    # 发送开始消息
-    progress_queue.put(
-        {
-            "pid": pid,
-            "filename": filename,
-            "status": "started",
-            "file_size": file_size,
-            "message": f"进程 {pid:>5} 开始生成文件 {filename:<10} ({file_size/(1024*1024):6.2f} MB)...",
-        }
-    )
+    # 发送开始消息（消息文本由监控器格式化，子进程只发送紧凑的元组）
+    progress_queue.put((STARTED, pid, filename, 0, file_size, 0, 0))
 
     start_time = time.time()
     last_report_time = start_time
+    bytes_written = 0
+    # 进度报告间隔：至少5秒，大文件按每500MB一秒放宽，减少进度消息数量
+    report_interval = max(5.0, file_size / (500 * MB))
 
     try:
-        with open(filename, "wb") as f:
-            bytes_written = 0
+        if offset is None:
+            fd, direct = _open_output(filename)
+        else:
+            fd, direct = _open_slab(offset), False
+        # 写入文件末尾时会关闭O_DIRECT，这里记下打开时的状态供最后释放页缓存时使用
+        opened_direct = direct
+        try:
+            if offset is None:
+                # 聚合文件已由主进程整体预分配
+                _preallocate(fd, file_size)
 
             while bytes_written < file_size:
-                remaining = file_size - bytes_written
-                current_buffer_size = min(buffer_size, remaining)
-
-                # 使用优化的随机字节生成方法
-                # 方法1: 使用os.urandom (最快的方法)
-                try:
-                    random_bytes = os.urandom(current_buffer_size)
-                except:
-                    # 方法2: 使用预先生成的随机块
-                    # 创建一个预生成的随机块池，避免重复生成
-                    random_bytes = bytes(
-                        random.randint(0, 255) for _ in range(int(current_buffer_size))
+                current_buffer_size = min(_buffer_size, file_size - bytes_written)
+
+                # 从模板中随机的4096字节对齐位置开始切片，不同块、不同文件的内容各不相同
+                start = _DIRECT_ALIGN * random.randrange(
+                    (len(_template) - current_buffer_size) // _DIRECT_ALIGN + 1
+                )
+                random_bytes = memoryview(_template)[
+                    start : start + current_buffer_size
+                ]
+
+                # 再把递增计数器异或进块头16个字节（不足16字节的极小块不处理）。
+                # 必须以原始头部为基准异或：若在上一次的结果上累加异或，头部是1..n的前缀异或，
+                # 每4个块就会回到同一个值（第1、5、9…块完全相同）。写完后恢复原始头部
+                head = None
+                if current_buffer_size >= 16:
+                    _block_counter += 1
+                    head = struct.unpack_from("<QQ", _template, start)
+                    struct.pack_into(
+                        "<QQ",
+                        _template,
+                        start,
+                        head[0] ^ _block_counter,
+                        head[1] ^ _block_counter,
                     )
 
-                # 写入文件
-                f.write(random_bytes)
+                # 写入文件（缓冲区按页对齐且为4MB，只有文件末尾的块可能不满足O_DIRECT的对齐要求）
+                tail_size = current_buffer_size % _DIRECT_ALIGN
+                if direct and tail_size:
+                    # 对齐的前缀仍用O_DIRECT写入，只有不足对齐长度的尾部改用普通写入
+                    aligned_size = current_buffer_size - tail_size
+                    if aligned_size:
+                        _write_all(fd, random_bytes[:aligned_size])
+                    _disable_direct_io(fd)
+                    direct = False
+                    _write_all(fd, random_bytes[aligned_size:])
+                else:
+                    _write_all(fd, random_bytes)
+                # os.write是同步的，写完后即可恢复模板，供后面的块使用
+                if head is not None:
+                    struct.pack_into("<QQ", _template, start, *head)
                 bytes_written += current_buffer_size
 
-                # 定期报告进度（每5秒最多一次）
+                # 定期报告进度（每report_interval秒最多一次）
                 current_time = time.time()
-                if current_time - last_report_time >= 5.0:  # 每5秒报告一次
-                    progress = (bytes_written / file_size) * 100
+                if current_time - last_report_time >= report_interval:
                     elapsed = current_time - start_time
                     if elapsed > 0:
                         speed = bytes_written / (1024 * 1024) / elapsed  # MB/s
@@ -64,19 +247,31 @@ def generate_single_file(file_info, progress_queue):
                         speed = 0
 
                     progress_queue.put(
-                        {
-                            "pid": pid,
-                            "filename": filename,
-                            "status": "progress",
-                            "progress": progress,
-                            "bytes_written": bytes_written,
-                            "file_size": file_size,
-                            "speed": speed,
-                            "elapsed": elapsed,
-                        }
+                        (
+                            PROGRESS,
+                            pid,
+                            filename,
+                            bytes_written,
+                            file_size,
+                            speed,
+                            elapsed,
+                        )
                     )
                     last_report_time = current_time
 
+            # 写出的数据不会再被读取，写完后释放它占用的页缓存
+            if offset is not None:
+                _drop_page_cache(fd, offset, file_size, sync=False)
+            elif opened_direct:
+                # O_DIRECT写入的部分不经过页缓存，只剩不足4096字节的尾部；
+                # 不再为它fdatasync（每个文件一次设备刷写和日志提交），只提示丢弃尾部
+                tail_start = file_size - file_size % _DIRECT_ALIGN
+                _drop_page_cache(fd, tail_start, file_size - tail_start, sync=False)
+            else:
+                _drop_page_cache(fd, 0, file_size)
+        finally:
+            os.close(fd)
+
         end_time = time.time()
         elapsed = end_time - start_time
         speed = 9999
@@ -85,33 +280,39 @@ def generate_single_file(file_info, progress_queue):
 
         # 发送完成消息
         progress_queue.put(
-            {
-                "pid": pid,
-                "filename": filename,
-                "status": "completed",
-                "message": f"进程 {pid:>5} 完成 {filename:<10} - 耗时: {elapsed:6.2f}秒, 速度: {speed:5.2f} MB/s",
-                "elapsed": elapsed,
-                "speed": speed,
-            }
+            (COMPLETED, pid, filename, file_size, file_size, speed, elapsed)
         )
 
         return filename, file_size
 
     except Exception as e:
         # 发送错误消息
+        elapsed = time.time() - start_time
         progress_queue.put(
-            {
-                "pid": pid,
-                "filename": filename,
-                "status": "error",
-                "message": f"进程 {pid:>5} 生成文件 {filename:<10} 时出错: {str(e)}",
-            }
+            (ERROR, pid, filename, bytes_written, file_size, 0, elapsed, str(e))
         )
         raise
 
 
-def progress_monitor(progress_queue, total_files, total_size_bytes):
-    """进度监控器，在主进程中运行，显示所有子进程的进度"""
+def _new_process_info(filename, file_size):
+    """创建监控器中记录单个进程当前文件进度的对象"""
+    now = time.time()
+    return SimpleNamespace(
+        filename=filename,
+        progress=0,
+        bytes_written=0,
+        file_size=file_size,
+        speed=0,
+        start_time=now,
+        last_update=now,
+    )
+
+
+def progress_monitor(progress_queue, total_files, total_size_bytes, unit="文件"):
+    """进度监控器，在主进程中运行，显示所有子进程的进度
+
+    unit为每个任务的显示名称，聚合模式下为"区段"。
+    """
     # 存储每个进程的进度信息
     process_info = {}
     completed_files = 0
@@ -121,97 +322,77 @@ def progress_monitor(progress_queue, total_files, total_size_bytes):
     print("进度监控器已启动，显示所有子进程的实时进度...")
     print("=" * 100)
 
-    while completed_files < total_files:
-        try:
-            # 从队列中获取进度信息（阻塞，最多等待1秒）
-            info = progress_queue.get(timeout=1)
-            pid = info["pid"]
-            filename = info["filename"]
-
-            if info["status"] == "started":
-                print(f"[{time.strftime('%H:%M:%S')}] {info['message']}")
-                # 确保从消息中获取文件大小
-                file_size = info.get("file_size", 0)
-                process_info[pid] = {
-                    "filename": filename,
-                    "progress": 0,
-                    "bytes_written": 0,
-                    "file_size": file_size,
-                    "speed": 0,
-                    "start_time": time.time(),
-                }
-
-            elif info["status"] == "progress":
-                # 确保在更新进度信息时也更新文件大小
-                file_size = info.get(
-                    "file_size", process_info.get(pid, {}).get("file_size", 0)
-                )
-                if pid not in process_info:
-                    process_info[pid] = {
-                        "filename": filename,
-                        "progress": 0,
-                        "bytes_written": 0,
-                        "file_size": file_size,
-                        "speed": 0,
-                        "start_time": time.time(),
-                    }
-
-                process_info[pid].update(
-                    {
-                        "progress": info["progress"],
-                        "bytes_written": info["bytes_written"],
-                        "file_size": file_size,  # 确保文件大小也被更新
-                        "speed": info["speed"],
-                        "last_update": time.time(),
-                    }
-                )
-
-                # 显示这个进程的进度，使用固定宽度确保对齐
-                file_info = process_info[pid]
-                progress_str = f"{file_info['progress']:5.1f}%"
-                written_str = f"{file_info['bytes_written']/(1024*1024):6.2f}"
-                total_str = f"{file_info['file_size']/(1024*1024):6.2f}"
-                speed_str = f"{file_info['speed']:5.2f}"
-
-                print(
-                    f"[{time.strftime('%H:%M:%S')}] 进程 {pid:>5}: {filename:<10} - "
-                    f"进度: {progress_str} ({written_str}/{total_str} MB) - "
-                    f"速度: {speed_str} MB/s"
-                )
-
-            elif info["status"] == "completed":
-                print(f"[{time.strftime('%H:%M:%S')}] {info['message']}")
-                if pid in process_info:
-                    completed_files += 1
-                    completed_size += process_info[pid]["file_size"]
-
-                # 计算总体进度
-                progress = (completed_size / total_size_bytes) * 100
-                elapsed_time = time.time() - start_time
-                if elapsed_time > 0:
-                    overall_speed = (
-                        completed_size / (1024 * 1024 * 1024) / (elapsed_time / 3600)
-                    )  # GB/hour
-                else:
-                    overall_speed = 0
-
-                print(
-                    f"[{time.strftime('%H:%M:%S')}] 总体进度: {progress:5.1f}% "
-                    f"({completed_size/(1024*1024*1024):6.2f} GB / {total_size_bytes/(1024*1024*1024):6.2f} GB) - "
-                    f"速度: {overall_speed:6.2f} GB/小时 - "
-                    f"已完成 {completed_files:4d}/{total_files:4d} 个文件"
-                )
-                print("-" * 100)
-
-            elif info["status"] == "error":
-                print(f"[{time.strftime('%H:%M:%S')}] {info['message']}")
-
-        except:
-            # 队列为空，继续等待
-            pass
+    while True:
+        # 阻塞等待进度信息，直到收到结束标记
+        info = progress_queue.get()
+        if info[0] == DONE:
+            break
+        status, pid, filename, bytes_written, file_size, speed, elapsed = info[:7]
+
+        if status == STARTED:
+            print(
+                f"[{time.strftime('%H:%M:%S')}] 进程 {pid:>5} 开始生成{unit} {filename:<10} "
+                f"({file_size/(1024*1024):6.2f} MB)..."
+            )
+            process_info[pid] = _new_process_info(filename, file_size)
+
+        elif status == PROGRESS:
+            file_info = process_info.get(pid)
+            if file_info is None:
+                file_info = process_info[pid] = _new_process_info(filename, file_size)
+
+            # 直接修改属性，不再每次构造一个新字典再update合并
+            file_info.progress = (bytes_written / file_size) * 100
+            file_info.bytes_written = bytes_written
+            file_info.file_size = file_size  # 确保文件大小也被更新
+            file_info.speed = speed
+            file_info.last_update = time.time()
+
+            # 显示这个进程的进度，使用固定宽度确保对齐
+            # 直接用一个f-string格式化整行，不再先拼出各个子字符串
+            print(
+                f"[{time.strftime('%H:%M:%S')}] 进程 {pid:>5}: {filename:<10} - "
+                f"进度: {file_info.progress:5.1f}% "
+                f"({file_info.bytes_written/MB:6.2f}/{file_info.file_size/MB:6.2f} MB) - "
+                f"速度: {file_info.speed:5.2f} MB/s"
+            )
+
+        elif status == COMPLETED:
+            print(
+                f"[{time.strftime('%H:%M:%S')}] 进程 {pid:>5} 完成 {filename:<10} - "
+                f"耗时: {elapsed:6.2f}秒, 速度: {speed:5.2f} MB/s"
+            )
+            completed_files += 1
+            completed_size += file_size
+
+            # 计算总体进度
+            progress = (completed_size / total_size_bytes) * 100
+            elapsed_time = time.time() - start_time
+            if elapsed_time > 0:
+                overall_speed = (
+                    completed_size / (1024 * 1024 * 1024) / (elapsed_time / 3600)
+                )  # GB/hour
+            else:
+                overall_speed = 0
+
+            print(
+                f"[{time.strftime('%H:%M:%S')}] 总体进度: {progress:5.1f}% "
+                f"({completed_size/(1024*1024*1024):6.2f} GB / {total_size_bytes/(1024*1024*1024):6.2f} GB) - "
+                f"速度: {overall_speed:6.2f} GB/小时 - "
+                f"已完成 {completed_files:4d}/{total_files:4d} 个{unit}"
+            )
+            print("-" * 100)
+
+        elif status == ERROR:
+            print(
+                f"[{time.strftime('%H:%M:%S')}] 进程 {pid:>5} 生成{unit} {filename:<10} "
+                f"时出错: {info[7]}"
+            )
 
     total_time = time.time() - start_time
-    print(f"所有文件生成完成! 总共生成了 {total_files:4d} 个文件")
+    print(
+        f"所有{unit}生成完成! 总共生成了 {completed_files:4d}/{total_files:4d} 个{unit}"
+    )
     print(f"总大小: {completed_size/(1024*1024*1024):6.2f} GB")
     print(f"总耗时: {total_time:8.2f} 秒")
     print(
@@ -219,15 +400,51 @@ def progress_monitor(progress_queue, total_files, total_size_bytes):
     )
 
 
-def generate_random_bin_files_parallel():
-    """使用多进程生成多个文件"""
-    # 总大小设置为102GB
-    total_size_gb = 0.12
-    total_size_bytes = total_size_gb * 1024 * 1024 * 1024  # 102GB in bytes
+def _plan_file_sizes(total_size_bytes, min_file_size, max_file_size):
+    """随机规划每个文件的大小，使总和恰好等于total_size_bytes
+
+    用NumPy一次性抽取所有文件大小并求前缀和，而不是在Python循环中逐个random.randint。
+    最后一个文件截断为剩余的字节数。返回Python int列表。
+    """
+    rng = np.random.default_rng()
+    low, high = int(min_file_size), int(max_file_size)
+    # 按平均大小估算文件数，多抽几个作为余量；万一仍不够再补抽
+    n_est = int(total_size_bytes / ((low + high) / 2)) + 8
+    sizes = rng.integers(low, high + 1, size=n_est, dtype=np.int64)
+    while sizes.sum() < total_size_bytes:
+        sizes = np.concatenate(
+            [sizes, rng.integers(low, high + 1, size=n_est, dtype=np.int64)]
+        )
+
+    cumsum = np.cumsum(sizes)
+    # 第一个前缀和达到总大小的位置就是最后一个文件
+    count = int(np.searchsorted(cumsum, total_size_bytes)) + 1
+    sizes = sizes[:count]
+    sizes[-1] -= cumsum[count - 1] - total_size_bytes
+    return sizes.tolist()
+
+
+# 生成参数，main中的磁盘空间检查和generate_random_bin_files_parallel共用
+CONFIG = {
+    # 总大小（GB）
+    "total_size_gb": 0.12,
+    # 每个文件大小范围（字节）
+    "min_file_size": 0.1 * MB,
+    "max_file_size": 1.1 * MB,
+    # 为True时不生成大量小文件，而是把所有数据写入一个聚合文件（AGGREGATE_FILENAME），
+    # 各进程并行写入各自的区段，减少大量小文件带来的内核开销（路径查找、权限检查、元数据锁等）
+    "aggregate": False,
+}
 
-    # 每个文件大小范围（30MB到50MB）
-    min_file_size = 0.1 * 1024 * 1024  # 30MB in bytes
-    max_file_size = 1.1 * 1024 * 1024  # 50MB in bytes
+
+def generate_random_bin_files_parallel(config=CONFIG):
+    """使用多进程生成多个文件，参数见CONFIG"""
+    total_size_gb = config["total_size_gb"]
+    total_size_bytes = int(total_size_gb * GB)
+
+    min_file_size = config["min_file_size"]
+    max_file_size = config["max_file_size"]
+    aggregate = config["aggregate"]
 
     print(f"目标总大小: {total_size_gb:3f} GB")
     print(
@@ -235,31 +452,42 @@ def generate_random_bin_files_parallel():
     )
 
     # 预计算所有文件的大小和名称
-    file_tasks = []
-    bytes_written_total = 0
-    file_count = 0
-
-    while bytes_written_total < total_size_bytes:
-        # 为当前文件随机选择大小
-        remaining_bytes = total_size_bytes - bytes_written_total
-
-        # 如果剩余字节数小于最小文件大小，调整文件大小
-        if remaining_bytes < min_file_size:
-            current_file_size = remaining_bytes
-        else:
-            # 随机选择文件大小，但不超过剩余需要的大小
-            max_possible = min(max_file_size, remaining_bytes)
-            current_file_size = random.randint(int(min_file_size), int(max_possible))
+    sizes = _plan_file_sizes(total_size_bytes, min_file_size, max_file_size)
+    file_count = len(sizes)
+    bytes_written_total = sum(sizes)
 
+    if aggregate:
+        # 预先计算每个区段在聚合文件中的偏移量，并一次性创建、预分配整个文件
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).tolist()
+        try:
+            fd = os.open(AGGREGATE_FILENAME, _OPEN_FLAGS, 0o644)
+            try:
+                _preallocate(fd, bytes_written_total)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            # 例如磁盘空间不足时_preallocate抛出的ENOSPC
+            print(f"创建聚合文件 {AGGREGATE_FILENAME} 时出错: {e}")
+            if os.path.exists(AGGREGATE_FILENAME):
+                os.remove(AGGREGATE_FILENAME)
+            return 0
+        print(f"聚合模式: 所有数据写入 {AGGREGATE_FILENAME}")
+        # 区段只是聚合文件中的一段，名称仅用于显示
+        unit = "区段"
+        names = [f"#{i:04d}" for i in range(file_count)]
+    else:
+        offsets = [None] * file_count
+        unit = "文件"
         # 生成文件名，使用4位数字格式
-        filename = f"d{file_count:04d}.bin"
-        file_tasks.append((filename, current_file_size))
+        names = [f"d{i:04d}.bin" for i in range(file_count)]
 
-        bytes_written_total += current_file_size
-        file_count += 1
+    file_tasks = list(zip(names, sizes, offsets))
+
+    # 按文件大小从大到小排序后再分发（LPT调度），避免大文件留到最后导致其他进程空闲
+    file_tasks.sort(key=lambda t: -t[1])
 
     print(
-        f"将生成 {file_count:4d} 个文件，总大小: {bytes_written_total/(1024*1024*1024):6.2f} GB"
+        f"将生成 {file_count:4d} 个{unit}，总大小: {bytes_written_total/(1024*1024*1024):6.2f} GB"
     )
 
     # 使用更保守的进程数，避免内存问题
@@ -267,36 +495,31 @@ def generate_random_bin_files_parallel():
     num_processes = min(multiprocessing.cpu_count(), 16, len(file_tasks))
     print(f"使用 {num_processes:2d} 个进程并行生成文件...")
 
-    # 创建Manager和共享队列
-    manager = multiprocessing.Manager()
-    progress_queue = manager.Queue()
+    # 创建共享队列（直接使用multiprocessing.Queue，避免Manager服务进程的代理开销）
+    progress_queue = multiprocessing.Queue(maxsize=4096)
 
     # 启动进度监控器线程
-    from threading import Thread
-
-    monitor_thread = Thread(
+    monitor_thread = threading.Thread(
         target=progress_monitor,
-        args=(progress_queue, len(file_tasks), total_size_bytes),
+        args=(progress_queue, len(file_tasks), total_size_bytes, unit),
     )
     monitor_thread.daemon = True
     monitor_thread.start()
 
-    # 给一点时间让监控线程启动
-    time.sleep(1)
-
     # 使用多进程池处理任务，但限制同时运行的进程数
     start_time = time.time()
 
     try:
-        # 使用更小的chunksize来更好地分配任务
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            # 使用partial函数将progress_queue传递给generate_single_file
-            worker_func = partial(generate_single_file, progress_queue=progress_queue)
-
-            # 使用imap_unordered并行处理任务，使用更小的chunksize
-            results = []
-            for result in pool.imap_unordered(worker_func, file_tasks, chunksize=1):
-                results.append(result)
+        # 进度队列通过初始化函数传给每个子进程；chunksize保持为1以便负载均衡。
+        # 退出with时执行器会等待子进程正常退出，子进程退出前会把队列中尚未发送的
+        # 进度消息全部写出，保证它们都排在结束标记之前
+        with ProcessPoolExecutor(
+            max_workers=num_processes,
+            initializer=_worker_init,
+            initargs=(progress_queue, BUFFER_SIZE),
+        ) as executor:
+            for _ in executor.map(generate_single_file, file_tasks):
+                pass
 
     except Exception as e:
         print(f"处理过程中发生错误: {e}")
@@ -306,32 +529,33 @@ def generate_random_bin_files_parallel():
 
     total_time = time.time() - start_time
 
-    # 等待监控线程完成
-    monitor_thread.join(timeout=5)
-
-    # 关闭manager
-    manager.shutdown()
+    # 通知监控线程结束并等待其打印汇总信息
+    progress_queue.put((DONE,))
+    monitor_thread.join()
 
     return file_count
 
 
 def main():
-    print("开始使用多进程生成102GB的随机二进制文件集合...")
-    print("使用稳定版本：512KB缓冲区，优化的随机数生成，保守的进程数")
+    total_size_gb = CONFIG["total_size_gb"]
+    print(f"开始使用多进程生成{total_size_gb}GB的随机二进制文件集合...")
+    print("使用稳定版本：4MB缓冲区，优化的随机数生成，保守的进程数")
 
-    # 检查磁盘空间
+    # 检查磁盘空间（不再用input()阻塞等待确认，便于在自动化测试环境中运行）
     try:
         total, used, free = shutil.disk_usage(".")
-        required_space = 102 * 1024 * 1024 * 1024  # 102GB in bytes
+        required_space = int(total_size_gb * GB)
 
         if free < required_space:
-            print(f"警告: 磁盘空间不足!")
-            print(f"需要: {required_space/(1024*1024*1024):6.2f} GB")
-            print(f"可用: {free/(1024*1024*1024):6.2f} GB")
-            response = input("是否继续? (y/n): ")
-            if response.lower() != "y":
-                print("操作已取消")
-                return
+            print("警告: 磁盘空间不足!")
+            print(f"需要: {required_space/GB:6.2f} GB")
+            print(f"可用: {free/GB:6.2f} GB")
+            auto_confirm = os.environ.get("AUTO_CONFIRM", "").strip().lower()
+            if auto_confirm not in ("1", "y", "yes"):
+                print("操作已取消（设置环境变量AUTO_CONFIRM=1可忽略此检查继续执行）")
+                # 以非零状态退出，便于自动化脚本区分取消和成功
+                sys.exit(1)
+            print("已设置AUTO_CONFIRM，继续执行")
     except Exception as e:
         print(f"无法检查磁盘空间: {e}")
         print("将继续执行，但请确保有足够的磁盘空间...")
@@ -339,7 +563,13 @@ def main():
     # 生成文件
     file_count = generate_random_bin_files_parallel()
 
-    print(f"完成! 共生成 {file_count:4d} 个文件，总大小约102GB")
+    if CONFIG["aggregate"]:
+        print(
+            f"完成! 共向 {AGGREGATE_FILENAME} 写入 {file_count:4d} 个区段，"
+            f"总大小约{total_size_gb}GB"
+        )
+    else:
+        print(f"完成! 共生成 {file_count:4d} 个文件，总大小约{total_size_gb}GB")
 
 
 if __name__ == "__main__":